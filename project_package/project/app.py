@@ -4,12 +4,12 @@ from __future__ import annotations
 import logging
 import sqlite3
 from datetime import datetime
-from typing import Dict, List
+from typing import List
 
-from flask import Flask, flash, redirect, render_template, request, url_for
+from flask import Flask, flash, jsonify, redirect, render_template, request, url_for
 from markupsafe import Markup
 
-from . import database
+from . import config, database
 
 LOGGER = logging.getLogger(__name__)
 
@@ -29,13 +29,27 @@ def _format_timestamp(value: str | None) -> Markup:
 def create_app() -> Flask:
     """Создать и настроить экземпляр Flask-приложения."""
     app = Flask(__name__)
-    app.config["SECRET_KEY"] = "change-me"  # TODO: вынести в config.py/.env
+    app.config["SECRET_KEY"] = config.SECRET_KEY
 
     logging.basicConfig(level=logging.INFO)
 
-    database.init_db()
     app.jinja_env.filters["format_ts"] = _format_timestamp
 
+    @app.cli.command("init-db")
+    def init_db_command() -> None:
+        """Инициализировать схему базы данных."""
+        database.init_db()
+        print("База данных инициализирована.")
+
+    @app.before_request
+    def ensure_db() -> None:
+        """Лениво инициализировать схему перед первым обращением к базе.
+
+        init_db защищён флагом «выполнено один раз», поэтому повторные
+        запросы не платят за проверку схемы.
+        """
+        database.init_db()
+
     @app.route("/")
     def index() -> str:
         """Переадресовать на список заявок."""
@@ -43,12 +57,22 @@ def create_app() -> Flask:
 
     @app.route("/requests")
     def list_requests() -> str:
-        """Отобразить список заявок из базы данных."""
+        """Отобразить список заявок из базы данных.
+
+        Параметр ?format=json отдаёт данные без рендеринга шаблона —
+        для скриптов и внутренних инструментов это дешевле Jinja.
+        """
         try:
-            requests_data: List[Dict[str, str]] = database.get_requests()
+            # sqlite3.Row поддерживает доступ по имени столбца, шаблону
+            # этого достаточно — без перекладывания в dict.
+            requests_data: List[sqlite3.Row] = database.get_requests()
         except sqlite3.Error:
+            if request.args.get("format") == "json":
+                return jsonify({"error": "Не удалось получить список заявок"}), 500
             flash("Не удалось получить список заявок", "error")
             requests_data = []
+        if request.args.get("format") == "json":
+            return jsonify([dict(row) for row in requests_data])
         return render_template("requests.html", requests=requests_data)
 
     @app.route("/new")
@@ -1,4 +1,4 @@
-﻿"""Configuration helpers for the OMIS project."""
+"""Configuration helpers for the OMIS project."""
 from __future__ import annotations
 
 import os
@@ -8,16 +8,42 @@ from typing import Final, Optional
 # Base directory of the project package.
 BASE_DIR: Final[Path] = Path(__file__).resolve().parent
 
+_ENV_LOADED = False
+
+
+def _load_env_once() -> None:
+    """Load the .env file into os.environ exactly once per process."""
+    global _ENV_LOADED
+    if _ENV_LOADED:
+        return
+    _ENV_LOADED = True
+    try:
+        from dotenv import load_dotenv
+    except ImportError:  # pragma: no cover - optional dependency
+        return
+    load_dotenv()
+
+
+_load_env_once()
+
+# Environment is read once at import; hot paths use the module constants
+# below instead of hitting os.environ on every access.
+_ENV: Final[dict[str, str]] = dict(os.environ)
+
 # SQLite database file path. Can be overridden via the OMIS_DB_FILE environment variable.
-DB_FILE: Final[Path] = Path(os.getenv("OMIS_DB_FILE", BASE_DIR / "omis.sqlite3"))
+DB_FILE: Final[Path] = Path(_ENV.get("OMIS_DB_FILE", str(BASE_DIR / "omis.sqlite3")))
+
+# Flask session secret. Override OMIS_SECRET_KEY in production.
+SECRET_KEY: Final[str] = _ENV.get("OMIS_SECRET_KEY", "change-me")
 
 # Telegram credentials (optional).
-TELEGRAM_TOKEN: Optional[str] = os.getenv("OMIS_TELEGRAM_TOKEN")
-TELEGRAM_CHAT_ID: Optional[str] = os.getenv("OMIS_TELEGRAM_CHAT_ID")
+TELEGRAM_TOKEN: Optional[str] = _ENV.get("OMIS_TELEGRAM_TOKEN")
+TELEGRAM_CHAT_ID: Optional[str] = _ENV.get("OMIS_TELEGRAM_CHAT_ID")
 
 __all__ = [
     "BASE_DIR",
     "DB_FILE",
+    "SECRET_KEY",
     "TELEGRAM_CHAT_ID",
     "TELEGRAM_TOKEN",
-]
\ No newline at end of file
+]
@@ -1,11 +1,14 @@
 ﻿"""Слой работы с базой данных для управления заявками подрядчика."""
 from __future__ import annotations
 
+import functools
 import logging
+import queue
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
-from datetime import datetime
-from typing import Any, Dict, Iterator, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from .config import DB_FILE
 
@@ -13,15 +16,42 @@ LOGGER = logging.getLogger(__name__)
 DEFAULT_STATUS = "заявка отправлена"
 ROBOT_AUTHOR = "Робот"
 
+# Пул долгоживущих соединений: открытие sqlite3.connect на каждый запрос
+# оплачивается системными вызовами и прогревом кэша страниц, поэтому держим
+# готовые соединения и выдаём их по очереди.
+_POOL_SIZE = 10
+_POOL: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=_POOL_SIZE)
 
+# PRAGMA-настройки, применяемые к каждому новому соединению пула.
+# journal_mode=WAL здесь не нужен: режим журнала хранится в самом файле базы
+# и включается один раз в init_db.
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+@functools.cache
 def _ensure_db_dir() -> None:
-    """Создаёт каталог для файла базы данных, если он отсутствует."""
+    """Создаёт каталог для файла базы данных, если он отсутствует.
+
+    Кеш без аргументов превращает повторные вызовы в no-op: системный вызов
+    mkdir выполняется один раз за процесс, а не при каждом соединении.
+    """
     DB_FILE.parent.mkdir(parents=True, exist_ok=True)
 
 
 def _utc_now() -> str:
     """Возвращает текущий момент времени в ISO-формате без микросекунд."""
-    return datetime.utcnow().replace(microsecond=0).isoformat()
+    # time.gmtime + f-строка дешевле цепочки datetime.utcnow().replace(...)
+    # .isoformat() и не использует устаревший datetime.utcnow.
+    t = time.gmtime()
+    return (
+        f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}"
+        f"T{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+    )
 
 
 def _ensure_schema(conn: sqlite3.Connection) -> None:
@@ -40,12 +70,42 @@ def _ensure_schema(conn: sqlite3.Connection) -> None:
         )
 
 
-@contextmanager
-def _connect() -> Iterator[sqlite3.Connection]:
-    """Возвращает соединение SQLite с включённой фабрикой строк."""
+def _new_connection() -> sqlite3.Connection:
+    """Открывает и настраивает новое соединение для пула."""
     _ensure_db_dir()
-    connection = sqlite3.connect(DB_FILE)
+    connection = sqlite3.connect(DB_FILE, check_same_thread=False)
     connection.row_factory = sqlite3.Row
+    for pragma in _CONNECTION_PRAGMAS:
+        connection.execute(pragma)
+    return connection
+
+
+def _release(connection: sqlite3.Connection) -> None:
+    """Возвращает соединение в пул либо закрывает его, если пул заполнен."""
+    try:
+        _POOL.put_nowait(connection)
+    except queue.Full:
+        connection.close()
+
+
+# Активная транзакция текущего потока: пока она открыта, _connect выдаёт
+# общее соединение и не коммитит сам — итоговый COMMIT делает transaction().
+_ACTIVE = threading.local()
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    """Выдаёт соединение SQLite из пула с включённой фабрикой строк."""
+    active = getattr(_ACTIVE, "connection", None)
+    if active is not None:
+        # Идёт внешняя транзакция: работаем на её соединении, фиксацию и
+        # откат оставляем обёртке transaction().
+        yield active
+        return
+    try:
+        connection = _POOL.get_nowait()
+    except queue.Empty:
+        connection = _new_connection()
     try:
         yield connection
         connection.commit()
@@ -53,14 +113,77 @@ def _connect() -> Iterator[sqlite3.Connection]:
         connection.rollback()
         LOGGER.exception("Database error: %s", exc)
         raise
+    except BaseException:
+        # Любая другая ошибка в теле блока (включая KeyboardInterrupt) тоже
+        # не должна вернуть в пул соединение с открытой транзакцией.
+        connection.rollback()
+        raise
     finally:
-        connection.close()
+        _release(connection)
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Объединяет серию операций модуля в одну транзакцию.
+
+    Внутри блока вложенные вызовы функций модуля работают на общем
+    соединении без промежуточных commit: fsync оплачивается один раз на
+    пачку, а не на каждый вызов. Вложенные transaction() продолжают уже
+    открытую транзакцию.
+    """
+    if getattr(_ACTIVE, "connection", None) is not None:
+        yield _ACTIVE.connection
+        return
+    try:
+        connection = _POOL.get_nowait()
+    except queue.Empty:
+        connection = _new_connection()
+    _ACTIVE.connection = connection
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        yield connection
+        connection.commit()
+    except sqlite3.Error as exc:  # pragma: no cover - защитное логирование
+        connection.rollback()
+        LOGGER.exception("Database error: %s", exc)
+        raise
+    except BaseException:
+        # Ошибки вне sqlite (шаг сценария упал) тоже откатывают пачку.
+        connection.rollback()
+        raise
+    finally:
+        _ACTIVE.connection = None
+        _release(connection)
+
+
+_INITIALIZED = False
+
+# Номер актуальной схемы; хранится в PRAGMA user_version самого файла базы.
+# Увеличивайте при добавлении миграций в _ensure_schema.
+_SCHEMA_VERSION = 4
 
 
 def init_db() -> None:
-    """Создаёт таблицу заявок, индексы и выполняет миграции схемы."""
+    """Создаёт таблицу заявок, индексы и выполняет миграции схемы.
+
+    Повторные вызовы в рамках процесса ничего не делают: схема проверяется
+    один раз, а не при каждом создании приложения или воркера.
+    """
+    global _INITIALIZED
+    if _INITIALIZED:
+        return
     try:
         with _connect() as conn:
+            # Дешёвая проверка версии схемы: одно целое из заголовка базы
+            # вместо PRAGMA table_info и набора CREATE ... IF NOT EXISTS.
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= _SCHEMA_VERSION:
+                _INITIALIZED = True
+                return
+            # WAL-режим записывается в файл базы и переживает переоткрытие,
+            # поэтому включаем его один раз здесь: запись перестаёт блокировать
+            # чтение, а коммиты требуют меньше fsync-ов.
+            conn.execute("PRAGMA journal_mode=WAL")
             # SQL: создаём таблицу для хранения заявок и связанных метаданных.
             conn.execute(
                 """
@@ -85,6 +208,22 @@ def init_db() -> None:
                 """
             )
             _ensure_schema(conn)
+            # Миграция v4: убывающий idx_requests_recent дублировал индекс
+            # выше — ORDER BY ... DESC обслуживается обратным проходом по
+            # возрастающему индексу, а второй индекс лишь дорожал на записи.
+            conn.execute("DROP INDEX IF EXISTS idx_requests_recent")
+            # Миграция v3: backdate_request прежних версий записывал метки
+            # через голую datetime() с пробелом-разделителем; приводим их к
+            # T-формату _utc_now, иначе сортировка по сырому столбцу врёт.
+            conn.execute(
+                "UPDATE requests SET "
+                "status_updated_at = strftime('%Y-%m-%dT%H:%M:%S', status_updated_at), "
+                "created_at = strftime('%Y-%m-%dT%H:%M:%S', created_at) "
+                "WHERE status_updated_at LIKE '% %' OR created_at LIKE '% %'"
+            )
+            # PRAGMA не принимает параметры, но версия — доверенная константа.
+            conn.execute(f"PRAGMA user_version={_SCHEMA_VERSION:d}")
+        _INITIALIZED = True
     except sqlite3.Error as exc:
         LOGGER.exception("Failed to initialize database schema at %s: %s", DB_FILE, exc)
         raise
@@ -102,17 +241,7 @@ def add_request(
         with _connect() as conn:
             # SQL: вставляем заявку с автором и временными метками.
             cursor = conn.execute(
-                """
-                INSERT INTO requests (
-                    request_number,
-                    position_number,
-                    comment,
-                    comment_author,
-                    status,
-                    created_at,
-                    status_updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
+                _SQL_INSERT_REQUEST,
                 (
                     request_number,
                     position_number,
@@ -157,16 +286,14 @@ def update_status(
     """Обновляет статус существующей заявки."""
     timestamp = _utc_now()
     parameters: List[Any] = [new_status, timestamp, request_number]
-    where_clause = "request_number = ?"
+    # Суффикс для логов собираем один раз, а не в каждой ветке заново.
+    pos_suffix = f"/{position_number}" if position_number else ""
 
     if position_number is not None:
-        where_clause += " AND position_number = ?"
+        sql = _SQL_UPDATE_STATUS_POS
         parameters.append(position_number)
-
-    sql = (
-        "UPDATE requests SET status = ?, status_updated_at = ? "
-        f"WHERE {where_clause}"
-    )
+    else:
+        sql = _SQL_UPDATE_STATUS
 
     try:
         with _connect() as conn:
@@ -178,14 +305,14 @@ def update_status(
             LOGGER.info(
                 "Updated request %s%s to status '%s'",
                 request_number,
-                f"/{position_number}" if position_number else "",
+                pos_suffix,
                 new_status,
             )
         else:
             LOGGER.warning(
                 "No request found for %s%s when setting status '%s'",
                 request_number,
-                f"/{position_number}" if position_number else "",
+                pos_suffix,
                 new_status,
             )
         return updated
@@ -193,7 +320,7 @@ def update_status(
         LOGGER.exception(
             "Failed to update status for %s%s: %s",
             request_number,
-            f"/{position_number}" if position_number else "",
+            pos_suffix,
             exc,
         )
         raise
@@ -207,16 +334,14 @@ def update_comment(
 ) -> bool:
     """Обновляет комментарий и автора заявки."""
     parameters: List[Any] = [comment, author, request_number]
-    where_clause = "request_number = ?"
+    # Суффикс для логов собираем один раз, а не в каждой ветке заново.
+    pos_suffix = f"/{position_number}" if position_number else ""
 
     if position_number is not None:
-        where_clause += " AND position_number = ?"
+        sql = _SQL_UPDATE_COMMENT_POS
         parameters.append(position_number)
-
-    sql = (
-        "UPDATE requests SET comment = ?, comment_author = ? "
-        f"WHERE {where_clause}"
-    )
+    else:
+        sql = _SQL_UPDATE_COMMENT
 
     try:
         with _connect() as conn:
@@ -225,31 +350,203 @@ def update_comment(
             updated = cursor.rowcount > 0
 
         if updated:
-            LOGGER.info(
-                "Updated comment for request %s%s",
-                request_number,
-                f"/{position_number}" if position_number else "",
-            )
+            LOGGER.info("Updated comment for request %s%s", request_number, pos_suffix)
         else:
             LOGGER.warning(
                 "No request found for %s%s when saving comment",
                 request_number,
-                f"/{position_number}" if position_number else "",
+                pos_suffix,
             )
         return updated
     except sqlite3.Error as exc:
         LOGGER.exception(
             "Failed to update comment for %s%s: %s",
             request_number,
+            pos_suffix,
+            exc,
+        )
+        raise
+
+
+
+
+
+
+# SQL-константы для горячих путей: кэш подготовленных выражений sqlite3
+# ориентируется на идентичность строки запроса, поэтому текст не должен
+# пересобираться f-строкой при каждом вызове.
+_SQL_INSERT_REQUEST = (
+    "INSERT INTO requests (request_number, position_number, comment, "
+    "comment_author, status, created_at, status_updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_SQL_UPDATE_STATUS = (
+    "UPDATE requests SET status = ?, status_updated_at = ? "
+    "WHERE request_number = ?"
+)
+_SQL_UPDATE_STATUS_POS = _SQL_UPDATE_STATUS + " AND position_number = ?"
+_SQL_UPDATE_COMMENT = (
+    "UPDATE requests SET comment = ?, comment_author = ? "
+    "WHERE request_number = ?"
+)
+_SQL_UPDATE_COMMENT_POS = _SQL_UPDATE_COMMENT + " AND position_number = ?"
+# strftime возвращает результат в каноническом T-формате _utc_now: голая
+# datetime() вставляет пробел между датой и временем, и такие строки ломают
+# лексикографическую сортировку get_requests (' ' < 'T').
+_SQL_BACKDATE = (
+    "UPDATE requests SET "
+    "status_updated_at = strftime('%Y-%m-%dT%H:%M:%S', datetime(status_updated_at, ?)), "
+    "created_at = strftime('%Y-%m-%dT%H:%M:%S', datetime(created_at, ?)) "
+    "WHERE request_number = ?"
+)
+_SQL_BACKDATE_POS = _SQL_BACKDATE + " AND position_number = ?"
+
+# SQL: совмещённое обновление статуса и комментария; RETURNING сразу
+# сообщает, нашлась ли заявка, без отдельного SELECT или проверки rowcount.
+_SQL_APPLY_MESSAGE = (
+    "UPDATE requests SET "
+    "status = COALESCE(?, status), "
+    "status_updated_at = CASE WHEN ? IS NULL THEN status_updated_at ELSE ? END, "
+    "comment = COALESCE(?, comment), "
+    "comment_author = CASE WHEN ? IS NULL THEN comment_author ELSE ? END "
+    "WHERE request_number = ? AND (? IS NULL OR position_number = ?) "
+    "RETURNING id"
+)
+
+
+def _apply_message_params(
+    request_number: str,
+    position_number: Optional[str],
+    new_status: Optional[str],
+    comment: Optional[str],
+    author: str,
+    timestamp: str,
+) -> Tuple[Any, ...]:
+    """Собирает параметры для _SQL_APPLY_MESSAGE в нужном порядке."""
+    return (
+        new_status,
+        new_status,
+        timestamp,
+        comment,
+        comment,
+        author,
+        request_number,
+        position_number,
+        position_number,
+    )
+
+
+def update_status_and_comment(
+    request_number: str,
+    new_status: Optional[str] = None,
+    comment: Optional[str] = None,
+    position_number: Optional[str] = None,
+    author: str = ROBOT_AUTHOR,
+) -> bool:
+    """Обновляет статус и комментарий заявки одним запросом.
+
+    Возвращает True, если заявка найдена; поля со значением ``None``
+    остаются без изменений.
+    """
+    parameters = _apply_message_params(
+        request_number, position_number, new_status, comment, author, _utc_now()
+    )
+    try:
+        with _connect() as conn:
+            matched = conn.execute(_SQL_APPLY_MESSAGE, parameters).fetchall()
+        return bool(matched)
+    except sqlite3.Error as exc:
+        LOGGER.exception(
+            "Failed to apply update for %s%s: %s",
+            request_number,
             f"/{position_number}" if position_number else "",
             exc,
         )
         raise
 
 
+def _existing_keys(
+    conn: sqlite3.Connection,
+    rows: Sequence[Tuple[str, Optional[str], Optional[str], Optional[str]]],
+) -> Tuple[set, set]:
+    """Одним заходом выясняет, какие ключи из пачки есть в базе.
+
+    Возвращает пару множеств: существующие пары (заявка, позиция) и
+    существующие номера заявок для строк без позиции.
+    """
+    pairs = sorted({(req, pos) for req, pos, _, _ in rows if pos is not None})
+    numbers = sorted({req for req, pos, _, _ in rows if pos is None})
+
+    existing_pairs: set = set()
+    if pairs:
+        # SQL: пакетная проверка пар через конструктор VALUES вместо
+        # отдельного SELECT на каждое сообщение.
+        placeholders = ", ".join("(?, ?)" for _ in pairs)
+        flat = [value for pair in pairs for value in pair]
+        cursor = conn.execute(
+            "SELECT request_number, position_number FROM requests "
+            f"WHERE (request_number, position_number) IN (VALUES {placeholders})",
+            flat,
+        )
+        existing_pairs = {
+            (row["request_number"], row["position_number"]) for row in cursor
+        }
+
+    existing_numbers: set = set()
+    if numbers:
+        placeholders = ", ".join("?" for _ in numbers)
+        cursor = conn.execute(
+            "SELECT DISTINCT request_number FROM requests "
+            f"WHERE request_number IN ({placeholders})",
+            numbers,
+        )
+        existing_numbers = {row["request_number"] for row in cursor}
 
+    return existing_pairs, existing_numbers
 
 
+def bulk_apply_updates(
+    rows: Sequence[Tuple[str, Optional[str], Optional[str], Optional[str]]],
+) -> List[bool]:
+    """Применяет пачку совмещённых обновлений в одной транзакции.
+
+    Каждый элемент ``rows`` — кортеж ``(request_number, position_number,
+    new_status, comment)``. Возвращает для каждой строки признак того,
+    что заявка нашлась в базе.
+    """
+    if not rows:
+        return []
+    timestamp = _utc_now()
+    try:
+        with _connect() as conn:
+            # Предварительная пакетная выборка ключей: UPDATE выполняем только
+            # для заявок, которые реально существуют.
+            existing_pairs, existing_numbers = _existing_keys(conn, rows)
+            applied: List[bool] = []
+            for request_number, position_number, new_status, comment in rows:
+                if position_number is None:
+                    matched = request_number in existing_numbers
+                else:
+                    matched = (request_number, position_number) in existing_pairs
+                if matched:
+                    conn.execute(
+                        _SQL_APPLY_MESSAGE,
+                        _apply_message_params(
+                            request_number,
+                            position_number,
+                            new_status,
+                            comment,
+                            ROBOT_AUTHOR,
+                            timestamp,
+                        ),
+                    ).fetchall()
+                applied.append(matched)
+        LOGGER.info("Bulk update applied to %s of %s row(s)", sum(applied), len(rows))
+        return applied
+    except sqlite3.Error as exc:
+        LOGGER.exception("Failed bulk update of %s row(s): %s", len(rows), exc)
+        raise
+
 
 def backdate_request(
     request_number: str,
@@ -259,16 +556,13 @@ def backdate_request(
     """Move request timestamps back by the specified number of minutes."""
     delta_expr = f'-{int(minutes)} minutes'
     parameters: List[Any] = [delta_expr, delta_expr, request_number]
-    where_clause = 'request_number = ?'
+    pos_suffix = f'/{position_number}' if position_number else ''
 
     if position_number is not None:
-        where_clause += ' AND position_number = ?'
+        sql = _SQL_BACKDATE_POS
         parameters.append(position_number)
-
-    sql = (
-        f"UPDATE requests SET status_updated_at = datetime(status_updated_at, ?), "
-        f"created_at = datetime(created_at, ?) WHERE {where_clause}"
-    )
+    else:
+        sql = _SQL_BACKDATE
 
     try:
         with _connect() as conn:
@@ -278,7 +572,7 @@ def backdate_request(
         LOGGER.exception(
             'Failed to backdate request %s%s: %s',
             request_number,
-            f'/{position_number}' if position_number else '',
+            pos_suffix,
             exc,
         )
         raise
@@ -287,14 +581,14 @@ def backdate_request(
         LOGGER.info(
             'Backdated request %s%s by %s minutes',
             request_number,
-            f'/{position_number}' if position_number else '',
+            pos_suffix,
             minutes,
         )
     else:
         LOGGER.warning(
             'No request found for %s%s when attempting backdate',
             request_number,
-            f'/{position_number}' if position_number else '',
+            pos_suffix,
         )
     return updated
 
@@ -320,12 +614,19 @@ def get_delayed_requests(minutes: int = 60) -> List[Dict[str, Any]]:
         LOGGER.exception("Failed to fetch delayed requests: %s", exc)
         raise
 
-def get_requests(limit: Optional[int] = None) -> List[Dict[str, Any]]:
-    """Возвращает список заявок, отсортированный по времени обновления статуса."""
+def get_requests(limit: Optional[int] = None) -> List[sqlite3.Row]:
+    """Возвращает список заявок, отсортированный по времени обновления статуса.
+
+    Строки отдаются как ``sqlite3.Row``: они поддерживают доступ по имени
+    столбца, поэтому перекладывать каждую запись в dict не нужно.
+    """
     query = (
         "SELECT id, request_number, position_number, comment, comment_author, "
         "status, created_at, status_updated_at "
-        "FROM requests ORDER BY datetime(status_updated_at) DESC"
+        # Метки времени из _utc_now имеют фиксированную ширину ISO-8601,
+        # поэтому лексикографический порядок совпадает с хронологическим и
+        # обёртка datetime() не нужна — планировщик может использовать индекс.
+        "FROM requests ORDER BY status_updated_at DESC"
     )
     parameters: List[Any] = []
 
@@ -336,9 +637,7 @@ def get_requests(limit: Optional[int] = None) -> List[Dict[str, Any]]:
     try:
         with _connect() as conn:
             # SQL: загружаем заявки, наиболее актуальные по времени обновления.
-            cursor = conn.execute(query, parameters)
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+            return conn.execute(query, parameters).fetchall()
     except sqlite3.Error as exc:
         LOGGER.exception("Failed to fetch requests: %s", exc)
         raise
@@ -349,9 +648,12 @@ __all__ = [
     "DEFAULT_STATUS",
     "ROBOT_AUTHOR",
     "add_request",
+    "bulk_apply_updates",
     "get_delayed_requests",
     "get_requests",
     "init_db",
+    "transaction",
     "update_comment",
     "update_status",
+    "update_status_and_comment",
 ]
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import logging
 import os
 import re
@@ -13,13 +14,8 @@ from . import database
 
 LOGGER = logging.getLogger(__name__)
 
-try:  # pragma: no cover - необязательная зависимость
-    # exchangelib нужен только при живом подключении к Outlook, поэтому импортируем
-    # его лениво и спокойно переживаем отсутствие библиотеки в dev-окружении.
-    from exchangelib import Account, Configuration, DELEGATE, Message, OAuth2Credentials
-except ImportError:  # pragma: no cover - необязательная зависимость
-    Account = Configuration = Message = OAuth2Credentials = None  # type: ignore[assignment]
-    DELEGATE = None  # type: ignore[assignment]
+# Нулевое смещение для быстрой проверки «время уже в UTC».
+_ZERO_OFFSET = timedelta(0)
 
 # Словарь ключевых фраз, по которым определяем статус заявки в письме.
 STATUS_KEYWORDS = {
@@ -29,12 +25,58 @@ STATUS_KEYWORDS = {
     "подрядчик убыл": ("убыл", "завершил", "законч"),
 }
 
-# Регулярные выражения, вытаскивающие номера заявок/позиций из свободного текста.
-REQUEST_RE = re.compile(r"(?:заявк[аи]|req)[^0-9]*(?P<number>\d+)", re.IGNORECASE)
-POSITION_RE = re.compile(r"(?:позици[яи]|pos)[^0-9]*(?P<number>\d+)", re.IGNORECASE)
+# Резервный путь без pyahocorasick: одно регулярное выражение-альтернация
+# со всеми ключевыми фразами. Движок re сканирует текст одним проходом в C
+# вместо отдельного поиска каждой фразы.
+_STATUS_LABELS: Tuple[str, ...] = tuple(STATUS_KEYWORDS)
+_STATUS_RE = re.compile(
+    "|".join(
+        f"(?P<s{index}>{'|'.join(map(re.escape, keywords))})"
+        for index, keywords in enumerate(STATUS_KEYWORDS.values())
+    )
+)
+
+try:  # pragma: no cover - необязательная зависимость
+    # pyahocorasick даёт один линейный проход по тексту вместо поиска каждой
+    # ключевой фразы по отдельности; без библиотеки остаётся обычный перебор.
+    import ahocorasick
+except ImportError:  # pragma: no cover - необязательная зависимость
+    ahocorasick = None  # type: ignore[assignment]
 
 
-@dataclass
+def _build_status_automaton() -> Optional["ahocorasick.Automaton"]:
+    """Собирает автомат Ахо-Корасик по словарю STATUS_KEYWORDS."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for status, keywords in STATUS_KEYWORDS.items():
+        for keyword in keywords:
+            automaton.add_word(keyword, status)
+    automaton.make_automaton()
+    return automaton
+
+
+_STATUS_AUTOMATON = _build_status_automaton()
+
+# Единое регулярное выражение, вытаскивающее номера заявок и позиций из
+# свободного текста: одна проходка движка вместо двух отдельных поисков.
+# Текст заранее приводится к нижнему регистру, поэтому IGNORECASE с его
+# посимвольным кейс-маппингом при сопоставлении не нужен.
+# Разрыв между словом и числом ограничен: неограниченный [^0-9]* на телах
+# без цифр заставлял движок пробегать большие участки текста с каждой
+# стартовой позиции.
+NUMBERS_RE = re.compile(
+    r"(?:(?:заявк[аи]|req)[^0-9]{0,8}(?P<req>\d+))"
+    r"|(?:(?:позици[яи]|pos)[^0-9]{0,8}(?P<pos>\d+))"
+)
+
+# Дешёвый префильтр перед NUMBERS_RE: оператор in работает через memmem в C
+# и на текстах без маркеров обходится куда дешевле запуска регулярного
+# выражения с альтернацией.
+_NUMBER_MARKERS: Tuple[str, ...] = ("заявк", "req", "позици", "pos")
+
+
+@dataclass(slots=True, frozen=True)
 class ContractorMessage:
     """Единый формат данных, полученных из письма подрядчика."""
 
@@ -47,7 +89,7 @@ class ContractorMessage:
     subject: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class OutlookSettings:
     """Настройки подключения к Outlook, собранные из переменных окружения."""
 
@@ -82,8 +124,13 @@ FAKE_CONTRACTOR_MESSAGES: Sequence[dict] = (
 )
 
 
+@functools.lru_cache(maxsize=1)
 def _load_outlook_settings() -> Optional[OutlookSettings]:
-    """Собирает и валидирует секреты для подключения к Outlook."""
+    """Собирает и валидирует секреты для подключения к Outlook.
+
+    Окружение в рамках одного процесса не меняется, поэтому результат
+    кешируется: повторные вызовы не перечитывают переменные окружения.
+    """
 
     # Каждое значение чистим от случайных пробелов, чтобы ошибки копирования
     # реквизитов не ломали авторизацию.
@@ -137,7 +184,18 @@ def _load_outlook_settings() -> Optional[OutlookSettings]:
 def _iter_outlook_messages(settings: OutlookSettings) -> Iterator[ContractorMessage]:
     """Подключается к Outlook и превращает найденные письма в ContractorMessage."""
 
-    if Account is None or OAuth2Credentials is None or Configuration is None or DELEGATE is None:
+    try:
+        # exchangelib тянет lxml/pytz и компилирует десятки регулярных
+        # выражений, поэтому импортируем его только при живом подключении:
+        # путь --fake и импорт модуля остаются лёгкими.
+        from exchangelib import (
+            Account,
+            Configuration,
+            DELEGATE,
+            Message,
+            OAuth2Credentials,
+        )
+    except ImportError:  # pragma: no cover - необязательная зависимость
         LOGGER.error(
             "Библиотека exchangelib не установлена, включите её для реальной синхронизации",
         )
@@ -174,87 +232,177 @@ def _iter_outlook_messages(settings: OutlookSettings) -> Iterator[ContractorMess
             LOGGER.exception("Не удалось открыть папку Outlook '%s': %s", part, exc)
             return
 
-    cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.lookback_minutes)
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(minutes=settings.lookback_minutes)
+    # Запасное время получения считаем один раз, а не в каждом исключении.
+    fallback_received = now.replace(tzinfo=None)
 
     try:
-        queryset = folder.filter(datetime_received__gte=cutoff).order_by("-datetime_received")
+        # Двухфазная выборка: сперва лёгкий список идентификаторов (срез
+        # транслируется exchangelib в серверную пагинацию), затем один
+        # пакетный GetItem за телами — вместо запроса на каждое письмо.
+        # item_class отсекает приглашения и уведомления ещё на сервере,
+        # чтобы не тратить пакетный GetItem на не-почтовые элементы.
+        id_query = (
+            folder.filter(datetime_received__gte=cutoff, item_class="IPM.Note")
+            .only("id", "changekey")
+            .order_by("-datetime_received")
+        )
+        # Размер страницы FindItem подгоняем под лимит, чтобы сервер не
+        # собирал страницу больше, чем мы вообще готовы обработать.
+        id_query.page_size = settings.max_messages
+        item_ids = list(id_query[: settings.max_messages])
     except Exception as exc:  # pragma: no cover - сетевые/фильтрационные ошибки
         LOGGER.exception("Не удалось получить список писем: %s", exc)
         return
 
-    processed = 0
-    for item in queryset:
-        if processed >= settings.max_messages:
-            break
+    if not item_ids:
+        return
+
+    try:
+        # .only/only_fields просит EWS вернуть лишь читаемые ниже поля: без
+        # вложений и прочего балласта ответ сервера становится в разы меньше.
+        items = account.fetch(
+            item_ids,
+            only_fields=["subject", "text_body", "body", "datetime_received", "sender", "author"],
+        )
+    except Exception as exc:  # pragma: no cover - сетевые ошибки
+        LOGGER.exception("Не удалось загрузить тела писем: %s", exc)
+        return
+
+    for item in items:
         if not isinstance(item, Message):
             # exchangelib может возвращать приглашения/уведомления; пропускаем их.
             continue
 
         try:
-            received_at = item.datetime_received.astimezone(timezone.utc).replace(tzinfo=None)
+            dt = item.datetime_received
+            # EWS почти всегда отдаёт время уже в UTC — в этом случае
+            # достаточно снять tzinfo без пересчёта через astimezone.
+            if dt.utcoffset() == _ZERO_OFFSET:
+                received_at = dt.replace(tzinfo=None)
+            else:
+                received_at = dt.astimezone(timezone.utc).replace(tzinfo=None)
         except Exception:
-            received_at = datetime.utcnow()
-
-        subject = item.subject or ""
-        body_plain = getattr(item, "text_body", None) or (item.body or "")
-
-        request_number, position_number = _extract_numbers(subject, body_plain)
-        status = _detect_status(f"{subject} {body_plain}")
-
+            received_at = fallback_received
+
+        # Крайние пробелы убираем один раз на входе; дальше все помощники
+        # работают с уже чистыми строками.
+        subject = (item.subject or "").strip()
+        body_plain = (getattr(item, "text_body", None) or (item.body or "")).strip()
+
+        # Текст в нижнем регистре считаем один раз на письмо и дальше
+        # переиспользуем во всех проверках.
+        lowered_subject = subject.lower()
+        lowered_body = body_plain.lower()
+        request_number, position_number = _extract_numbers(lowered_subject, lowered_body)
+        status = _detect_status_lowered(lowered_subject, lowered_body)
+
+        # item прошёл isinstance-проверку Message, поэтому sender/author —
+        # обычные поля: читаем их напрямую вместо каскада getattr.
         sender = "unknown@example.com"
-        if getattr(item, "sender", None) and getattr(item.sender, "email_address", None):
-            sender = item.sender.email_address  # type: ignore[assignment]
-        elif getattr(item, "author", None) and getattr(item.author, "email_address", None):
-            sender = item.author.email_address  # type: ignore[assignment]
+        for mailbox in (item.sender, item.author):
+            if mailbox is not None and mailbox.email_address:
+                sender = mailbox.email_address
+                break
 
-        payload = {"subject": subject, "body": body_plain}
         yield ContractorMessage(
             request_number=request_number or "",
             position_number=position_number,
             detected_status=status,
-            comment=_compose_comment(payload),
+            comment=_compose_comment(subject, body_plain),
             received_at=received_at,
             sender=sender,
             subject=subject,
         )
-        processed += 1
 
 
 def _detect_status(text: str) -> Optional[str]:
     """Возвращает статус, если в тексте письма найдено известное ключевое слово."""
-    lowered = text.lower()
-    for status, keywords in STATUS_KEYWORDS.items():
-        if any(keyword in lowered for keyword in keywords):
-            return status
+    return _detect_status_lowered(text.lower())
+
+
+def _detect_status_lowered(*texts: str) -> Optional[str]:
+    """Ищет статус в буферах, уже приведённых к нижнему регистру.
+
+    Принимает тему и тело отдельными аргументами: буферы сканируются по
+    очереди без склейки в одну строку, а первое совпадение побеждает.
+    """
+    for lowered in texts:
+        if _STATUS_AUTOMATON is not None:
+            # Один проход автомата по тексту вместо поиска каждого ключа.
+            for _, status in _STATUS_AUTOMATON.iter(lowered):
+                return status
+            continue
+        match = _STATUS_RE.search(lowered)
+        if match is not None:
+            # Имя сработавшей группы s<N> указывает на статус с тем же индексом.
+            return _STATUS_LABELS[int(match.lastgroup[1:])]
     return None
 
 
 def _extract_numbers(subject: str, body: str) -> tuple[Optional[str], Optional[str]]:
-    """Ищет номера заявки и позиции в теме и теле письма."""
+    """Ищет номера заявки и позиции в теме и теле письма.
+
+    Ожидает текст, уже приведённый к нижнему регистру: вызывающие циклы
+    делают это один раз на письмо и делятся результатом со всеми проверками.
+    """
     request_number = None
     position_number = None
 
     for text in (subject, body):
-        if request_number is None:
-            match = REQUEST_RE.search(text)
-            if match:
-                request_number = match.group("number")
-        if position_number is None:
-            match = POSITION_RE.search(text)
-            if match:
-                position_number = match.group("number")
+        if not any(marker in text for marker in _NUMBER_MARKERS):
+            continue
+        for match in NUMBERS_RE.finditer(text):
+            if request_number is None and match.group("req"):
+                request_number = match.group("req")
+            elif position_number is None and match.group("pos"):
+                position_number = match.group("pos")
+            if request_number is not None and position_number is not None:
+                return request_number, position_number
     return request_number, position_number
 
 
-def _compose_comment(message: dict) -> str:
-    """Формирует короткий комментарий по письму для занесения в БД."""
-    subject = message.get("subject", "").strip()
-    body = message.get("body", "").strip()
-    snippet = body.splitlines()[0] if body else ""
+def _compose_comment(subject: str, body: str) -> str:
+    """Формирует короткий комментарий по письму для занесения в БД.
+
+    Ожидает тему и тело, уже очищенные от крайних пробелов: циклы обработки
+    делают strip один раз при получении письма.
+    """
+    # Нужна только первая строка: split с лимитом не строит список всех строк
+    # длинного тела ради одного элемента. Срез до 200 символов ограничивает
+    # и поиск перевода строки — сканировать мегабайты HTML ради однострочной
+    # сводки незачем.
+    snippet = body[:200].split("\n", 1)[0].rstrip() if body else ""
     parts = [value for value in (subject, snippet) if value]
     return " - ".join(parts) if parts else "Содержимое письма недоступно"
 
 
+def _parse_fake_message(fake: dict) -> ContractorMessage:
+    """Разбирает одну запись тестовой фикстуры в ContractorMessage."""
+    subject = fake["subject"].strip()
+    body = fake.get("body", "").strip()
+    lowered_subject = subject.lower()
+    lowered_body = body.lower()
+    request_number, position_number = _extract_numbers(lowered_subject, lowered_body)
+    return ContractorMessage(
+        request_number=request_number or "",
+        position_number=position_number,
+        detected_status=_detect_status_lowered(lowered_subject, lowered_body),
+        comment=_compose_comment(subject, body),
+        received_at=fake.get("received", datetime.utcnow()),
+        sender=fake.get("sender", "unknown@example.com"),
+        subject=subject,
+    )
+
+
+# Фикстура статична, поэтому разбираем её один раз при импорте: повторные
+# прогоны fake-режима не тратят время на регулярные выражения.
+_FAKE_PARSED: Tuple[ContractorMessage, ...] = tuple(
+    _parse_fake_message(fake) for fake in FAKE_CONTRACTOR_MESSAGES
+)
+
+
 def fetch_contractor_messages(use_fake: bool = True) -> Iterable[ContractorMessage]:
     """Возвращает письма подрядчика из Outlook или подготовленный фейковый набор."""
 
@@ -271,71 +419,74 @@ def fetch_contractor_messages(use_fake: bool = True) -> Iterable[ContractorMessa
                 return
         LOGGER.warning("Переходим на тестовые письма, Outlook недоступен или не настроен.")
 
-    for fake in FAKE_CONTRACTOR_MESSAGES:
-        subject = fake["subject"]
-        body = fake.get("body", "")
-        request_number, position_number = _extract_numbers(subject, body)
-        yield ContractorMessage(
-            request_number=request_number or "",
-            position_number=position_number,
-            detected_status=_detect_status(subject + " " + body),
-            comment=_compose_comment(fake),
-            received_at=fake.get("received", datetime.utcnow()),
-            sender=fake.get("sender", "unknown@example.com"),
-            subject=subject,
-        )
+    yield from _FAKE_PARSED
+
 
+def process_mailbox(use_fake: bool = True) -> Iterator[str]:
+    """Объединяет письма с базой и выдаёт текстовые отчёты по каждой записи.
 
-def process_mailbox(use_fake: bool = True) -> List[str]:
-    """Объединяет письма с базой и возвращает текстовые отчёты по каждой записи."""
+    Генератор: CLI печатает строки по мере готовности, а вызывающий код,
+    которому нужен список целиком, оборачивает вызов в ``list(...)``.
+    """
 
-    # Список итоговых строк возвращаем вызывающему коду: CLI печатает их в терминал,
-    # а тесты могут проверять, что логика обновления сработала корректно.
-    results: List[str] = []
+    # Промежуточный список нужен, потому что итог по каждому письму известен
+    # только после пакетного применения обновлений; наружу строки отдаём лениво.
+    results: List[Optional[str]] = []
+    pending: List[Tuple[int, ContractorMessage]] = []
+    skipped_subjects: List[str] = []
 
     for message in fetch_contractor_messages(use_fake=use_fake):
         if not message.request_number:
-            LOGGER.warning(
-                "Не удалось определить номер заявки (subject=%s)",
-                message.subject,
-            )
+            # Не пишем предупреждение на каждое мусорное письмо: собираем
+            # темы и отчитываемся одной записью после цикла.
+            skipped_subjects.append(message.subject)
             results.append(
                 f"Пропуск письма от {message.sender}: не найден номер заявки"
             )
             continue
 
-        status_applied = False
-        comment_saved = False
+        # Обновления базы откладываем: применим их одной пачкой после цикла,
+        # а место под итоговую строку резервируем, чтобы сохранить порядок.
+        pending.append((len(results), message))
+        results.append(None)
 
-        if message.detected_status:
-            status_applied = database.update_status(
-                request_number=message.request_number,
-                new_status=message.detected_status,
-                position_number=message.position_number,
-            )
+    if skipped_subjects and LOGGER.isEnabledFor(logging.WARNING):
+        LOGGER.warning(
+            "Не удалось определить номер заявки в %s письме(ах): %s",
+            len(skipped_subjects),
+            "; ".join(skipped_subjects),
+        )
 
-        if message.comment:
-            comment_saved = database.update_comment(
-                request_number=message.request_number,
-                comment=message.comment,
-                position_number=message.position_number,
+    # Одна транзакция и один совмещённый UPDATE ... RETURNING на сообщение:
+    # признак «заявка нашлась» приходит сразу из базы.
+    applied = database.bulk_apply_updates(
+        [
+            (
+                message.request_number,
+                message.position_number,
+                message.detected_status,
+                message.comment or None,
             )
-
-        summary_parts = [
-            f"Заявка {message.request_number}",
-            f"позиция {message.position_number}" if message.position_number else "",
-            f"статус -> {message.detected_status}" if status_applied and message.detected_status else "",
-            "комментарий обновлён" if comment_saved else "",
+            for _, message in pending
         ]
-        summary = "; ".join(part for part in summary_parts if part)
-        if not summary:
-            summary = (
-                f"Данные из письма не применены (subject={message.subject}, "
-                f"request={message.request_number})"
-            )
-        results.append(summary)
+    )
+
+    for (index, message), matched in zip(pending, applied):
+        status_applied = matched and bool(message.detected_status)
+        comment_saved = matched and bool(message.comment)
+
+        # Пустые ветки не форматируем вовсе: f-строка вычисляется до
+        # фильтрации, поэтому добавляем части только по условию.
+        summary_parts = [f"Заявка {message.request_number}"]
+        if message.position_number:
+            summary_parts.append(f"позиция {message.position_number}")
+        if status_applied and message.detected_status:
+            summary_parts.append(f"статус -> {message.detected_status}")
+        if comment_saved:
+            summary_parts.append("комментарий обновлён")
+        results[index] = "; ".join(summary_parts)
 
-    return results
+    yield from (line for line in results if line is not None)
 
 
 def main(argv: Optional[Sequence[str]] = None) -> int:
@@ -358,13 +509,12 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
 
     logging.basicConfig(level=getattr(logging, args.log_level))
 
-    results = process_mailbox(use_fake=args.fake)
-    if not results:
-        print("Новых писем подрядчика не найдено.")
-        return 0
-
-    for line in results:
+    printed = False
+    for line in process_mailbox(use_fake=args.fake):
         print(line)
+        printed = True
+    if not printed:
+        print("Новых писем подрядчика не найдено.")
     return 0
 
 
@@ -2,18 +2,51 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional, Sequence
-from urllib import parse, request
+from urllib import request
 
 from . import config, database
 
+try:  # pragma: no cover - необязательная зависимость
+    # requests.Session держит keep-alive соединение с api.telegram.org:
+    # TCP+TLS-рукопожатие выполняется один раз на процесс, а не на сообщение.
+    import requests as _requests
+except ImportError:  # pragma: no cover - необязательная зависимость
+    _requests = None  # type: ignore[assignment]
+
 LOGGER = logging.getLogger(__name__)
 TELEGRAM_API_URL = "https://api.telegram.org"
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+_SESSION = None
+
+
+@functools.lru_cache(maxsize=4)
+def _bot_url(token: str) -> str:
+    """Собрать URL метода sendMessage один раз на токен."""
+    return f"{TELEGRAM_API_URL}/bot{token}/sendMessage"
+
+
+def _get_session():
+    """Вернуть общую HTTP-сессию, создав её при первом обращении."""
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = _requests.Session()
+    return _SESSION
+
 # <<< При необходимости адаптируйте шаблон сообщения под формат команды >>>
+# Шаблон собирается один раз на модуль, а не на каждую строку выборки.
+_DELAY_MESSAGE_TMPL = (
+    "⚠ Заявка №{req} (позиция {pos}) давно без обновлений.\n"
+    "Текущий статус: {status}.\n"
+    "Последнее обновление: {ts}."
+)
 
 
 def _format_delay_message(row: Dict[str, object]) -> str:
@@ -25,19 +58,10 @@ def _format_delay_message(row: Dict[str, object]) -> str:
     except ValueError:
         timestamp = updated_at
 
-    request_number = str(row.get("request_number", "?"))
-    position_number = str(row.get("position_number") or "-")
-    status = str(row.get("status", "неизвестно"))
-
-    message_template = (
-        "⚠ Заявка №{req} (позиция {pos}) давно без обновлений.\n"
-        "Текущий статус: {status}.\n"
-        "Последнее обновление: {ts}."
-    )
-    return message_template.format(
-        req=request_number,
-        pos=position_number,
-        status=status,
+    return _DELAY_MESSAGE_TMPL.format(
+        req=str(row.get("request_number", "?")),
+        pos=str(row.get("position_number") or "-"),
+        status=str(row.get("status", "неизвестно")),
         ts=timestamp,
     )
 
@@ -51,25 +75,34 @@ def send_message(text: str, token: Optional[str] = None, chat_id: Optional[str]
         LOGGER.info("[FAKE TELEGRAM] %s", text)
         return False
 
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "disable_web_page_preview": True,
-    }
-    data = parse.urlencode(payload).encode()
-    url = f"{TELEGRAM_API_URL}/bot{token}/sendMessage"
+    # JSON вместо form-encoding: json.dumps сериализует полезную нагрузку
+    # одним вызовом в C без поключевого квотирования urlencode.
+    data = json.dumps(
+        {"chat_id": chat_id, "text": text, "disable_web_page_preview": True}
+    ).encode()
+    url = _bot_url(token)
 
     try:
-        with request.urlopen(url, data=data, timeout=10) as response:
-            body = response.read().decode(errors="ignore")
-            if response.getcode() != 200:
-                LOGGER.error("Telegram API error: %s", body)
-                return False
-            result = json.loads(body or "{}")
-            success = result.get("ok", True)
-            if not success:
-                LOGGER.error("Telegram returned failure: %s", result)
-            return success
+        if _requests is not None:
+            response = _get_session().post(
+                url, data=data, headers=_JSON_HEADERS, timeout=10
+            )
+            status_code = response.status_code
+            body = response.text
+        else:
+            # Резервный путь без requests: одноразовое соединение.
+            req = request.Request(url, data=data, headers=_JSON_HEADERS)
+            with request.urlopen(req, timeout=10) as response:
+                status_code = response.getcode()
+                body = response.read().decode(errors="ignore")
+        if status_code != 200:
+            LOGGER.error("Telegram API error: %s", body)
+            return False
+        result = json.loads(body or "{}")
+        success = result.get("ok", True)
+        if not success:
+            LOGGER.error("Telegram returned failure: %s", result)
+        return success
     except Exception as exc:  # pragma: no cover - защитное логирование
         LOGGER.exception("Failed to send Telegram message: %s", exc)
         return False
@@ -78,18 +111,25 @@ def send_message(text: str, token: Optional[str] = None, chat_id: Optional[str]
 def notify_delays(minutes: int = 60, send: bool = True) -> List[str]:
     """Формирует список уведомлений по заявкам, которые не обновлялись дольше `minutes`."""
     delayed = database.get_delayed_requests(minutes)
-    notifications: List[str] = []
-
-    for row in delayed:
-        message = _format_delay_message(row)
-        notifications.append(message)
-        if send:
-            send_message(message)
-        else:
-            LOGGER.info("[DRY RUN] %s", message)
+    notifications = [_format_delay_message(row) for row in delayed]
 
-    if not delayed:
+    if not notifications:
         LOGGER.debug("Нет заявок с задержкой более %s минут", minutes)
+        return notifications
+
+    if not send:
+        for message in notifications:
+            LOGGER.info("[DRY RUN] %s", message)
+        return notifications
+
+    if len(notifications) == 1:
+        send_message(notifications[0])
+    else:
+        # Отправки сетевые и независимые: небольшой пул потоков перекрывает
+        # HTTP-задержки, а 4 воркеров заведомо ниже лимита Telegram
+        # (~30 сообщений в секунду). Порядок списка при этом сохраняется.
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(send_message, notifications))
 
     return notifications
 
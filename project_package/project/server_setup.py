@@ -2,9 +2,13 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import io
+import sys
 import textwrap
 from dataclasses import dataclass
-from typing import Iterable, List, Optional, Sequence
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence
 
 
 @dataclass
@@ -25,30 +29,100 @@ CORE_PYTHON_PACKAGES = (
     "exchangelib",
 )
 
+# Pre-sorted core set: the common no-extras call reuses this constant
+# instead of rebuilding a set and re-sorting on every invocation.
+_CORE_PIP_SORTED: tuple[str, ...] = tuple(sorted(CORE_PYTHON_PACKAGES))
+
+
+@functools.lru_cache(maxsize=8)
+def _base_apt_packages(python_version: str, use_nginx: bool) -> tuple[str, ...]:
+    """Return the base apt package tuple for a (python_version, use_nginx) pair."""
+
+    base = (f"python{python_version}", f"python{python_version}-venv", "git", "pipx")
+    return base + ("nginx",) if use_nginx else base
+
+# Config templates are dedented once at import; rendering a plan is then a
+# single .format call instead of re-scanning the literal for leading
+# whitespace on every invocation.
+_SYSTEMD_UNIT_TMPL = textwrap.dedent(
+    """
+    [Unit]
+    Description=OMIS automation runner
+    Wants=network-online.target
+    After=network-online.target
+
+    [Service]
+    Type=simple
+    User={user}
+    WorkingDirectory={workdir}
+    Environment=PATH={venv_path}/bin
+    ExecStart={venv_path}/bin/python -m project_package.runner --log-level INFO
+    Restart=on-failure
+    RestartSec=5
+
+    [Install]
+    WantedBy=multi-user.target
+    """
+).strip()
+
+# The nginx block has no variable parts, so it is a ready-to-use constant.
+_NGINX_CONF = textwrap.dedent(
+    """
+    server {
+        listen 80;
+        server_name _;
+
+        location / {
+            proxy_pass http://127.0.0.1:5000;
+            proxy_set_header Host $host;
+            proxy_set_header X-Real-IP $remote_addr;
+            proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+            proxy_set_header X-Forwarded-Proto $scheme;
+        }
+    }
+    """
+).strip()
+
+
+# Shell command templates expanded in one pass by prepare_server. Keeping
+# them as module tuples avoids rebuilding the same f-strings and list
+# appends for every host a caller plans.
+_BASE_COMMAND_TEMPLATES: tuple[str, ...] = (
+    "sudo apt-get update && sudo apt-get install -y {packages}",
+    "sudo useradd --system --create-home --shell /bin/bash {service_user} || true",
+    "sudo mkdir -p {parent_dir}",
+    "if [ ! -d {project_dir} ]; then sudo git clone https://github.com/talyu/omis.git {project_dir}; "
+    "else sudo git -C {project_dir} pull --ff-only; fi",
+    "sudo chown -R {service_user}:{service_user} {project_dir}",
+    "sudo -u {service_user} python{python_version} -m venv {venv}",
+    "sudo -u {service_user} {venv}/bin/pip install --upgrade pip",
+    "sudo -u {service_user} {venv}/bin/pip install {pip_packages}",
+)
 
-def _systemd_unit(service_name: str, user: str, workdir: str, venv_path: str) -> str:
-    """Render a minimal systemd unit for running the OMIS runner on boot."""
+# Smoke test depending on the profile so the operator immediately sees
+# whether the freshly configured server can reach the mail/notification code.
+_SMOKE_TEMPLATES = {
+    "virtual": "sudo -u {service_user} {venv}/bin/python -m project_package.project.mail_checker --fake",
+    "production": "sudo -u {service_user} {venv}/bin/python -m project_package.project.mail_checker --log-level INFO",
+}
+
+_NGINX_COMMAND_TEMPLATES: tuple[str, ...] = (
+    "sudo ln -sf /etc/nginx/sites-available/{service_name}.conf /etc/nginx/sites-enabled/{service_name}.conf",
+    "sudo nginx -t",
+    "sudo systemctl reload nginx",
+)
 
-    return textwrap.dedent(
-        f"""
-        [Unit]
-        Description=OMIS automation runner
-        Wants=network-online.target
-        After=network-online.target
+_SYSTEMD_COMMAND_TEMPLATES: tuple[str, ...] = (
+    "sudo systemctl daemon-reload",
+    "sudo systemctl enable {service_name}",
+    "sudo systemctl start {service_name}",
+)
 
-        [Service]
-        Type=simple
-        User={user}
-        WorkingDirectory={workdir}
-        Environment=PATH={venv_path}/bin
-        ExecStart={venv_path}/bin/python -m project_package.runner --log-level INFO
-        Restart=on-failure
-        RestartSec=5
 
-        [Install]
-        WantedBy=multi-user.target
-        """
-    ).strip()
+def _systemd_unit(service_name: str, user: str, workdir: str, venv_path: str) -> str:
+    """Render a minimal systemd unit for running the OMIS runner on boot."""
+
+    return _SYSTEMD_UNIT_TMPL.format(user=user, workdir=workdir, venv_path=venv_path)
 
 
 def _normalize_project_dir(raw: str) -> tuple[str, str]:
@@ -86,59 +160,32 @@ def prepare_server(
 
     project_dir, parent_dir = _normalize_project_dir(project_dir)
 
-    packages = [
-        f"python{python_version}",
-        f"python{python_version}-venv",
-        "git",
-        "pipx",
-    ]
-    if use_nginx:
-        packages.append("nginx")
-    packages.extend(list(additional_packages or ()))
-
-    commands: List[str] = []
+    extra_apt = tuple(additional_packages or ())
+    packages = _base_apt_packages(python_version, use_nginx)
+    if extra_apt:
+        packages += extra_apt
 
-    commands.append(
-        "sudo apt-get update && sudo apt-get install -y " + " ".join(packages)
-    )
-    commands.append(
-        f"sudo useradd --system --create-home --shell /bin/bash {service_user} || true"
-    )
-    commands.append(f"sudo mkdir -p {parent_dir}")
-    clone_cmd = (
-        "if [ ! -d {dir} ]; then sudo git clone https://github.com/talyu/omis.git {dir}; "
-        "else sudo git -C {dir} pull --ff-only; fi"
-    ).format(dir=project_dir)
-    commands.append(clone_cmd)
-    commands.append(f"sudo chown -R {service_user}:{service_user} {project_dir}")
-    commands.append(
-        f"sudo -u {service_user} python{python_version} -m venv {project_dir}/.venv"
-    )
-    commands.append(
-        f"sudo -u {service_user} {project_dir}/.venv/bin/pip install --upgrade pip"
-    )
-
-    pip_packages = sorted(set(CORE_PYTHON_PACKAGES).union(extra_pip or ()))
-    pip_cmd = "sudo -u {user} {venv}/bin/pip install {packages}".format(
-        user=service_user,
-        venv=f"{project_dir}/.venv",
-        packages=" ".join(pip_packages),
-    )
-    commands.append(pip_cmd)
-
-    # Run a smoke test depending on the profile so the operator immediately sees
-    # whether the freshly configured server can reach the mail/notification code.
-    if branch == "virtual":
-        commands.append(
-            "sudo -u {user} {venv}/bin/python -m project_package.project.mail_checker --fake".format(
-                user=service_user,
-                venv=f"{project_dir}/.venv",
-            )
-        )
+    extra_pip = tuple(extra_pip or ())
+    if extra_pip:
+        pip_packages: Sequence[str] = sorted(set(CORE_PYTHON_PACKAGES).union(extra_pip))
     else:
-        commands.append(
-            f"sudo -u {service_user} {project_dir}/.venv/bin/python -m project_package.project.mail_checker --log-level INFO"
-        )
+        pip_packages = _CORE_PIP_SORTED
+
+    ctx = {
+        "service_user": service_user,
+        "service_name": service_name,
+        "project_dir": project_dir,
+        "parent_dir": parent_dir,
+        "venv": f"{project_dir}/.venv",
+        "python_version": python_version,
+        "packages": " ".join(packages),
+        "pip_packages": " ".join(pip_packages),
+    }
+    templates = _BASE_COMMAND_TEMPLATES + (_SMOKE_TEMPLATES[branch],)
+    if use_nginx:
+        templates += _NGINX_COMMAND_TEMPLATES
+    templates += _SYSTEMD_COMMAND_TEMPLATES
+    commands: List[str] = [template.format_map(ctx) for template in templates]
 
     unit_path = f"/etc/systemd/system/{service_name}.service"
     config_files = [
@@ -154,39 +201,10 @@ def prepare_server(
     ]
 
     if use_nginx:
-        nginx_conf = textwrap.dedent(
-            f"""
-            server {{
-                listen 80;
-                server_name _;
-
-                location / {{
-                    proxy_pass http://127.0.0.1:5000;
-                    proxy_set_header Host $host;
-                    proxy_set_header X-Real-IP $remote_addr;
-                    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-                    proxy_set_header X-Forwarded-Proto $scheme;
-                }}
-            }}
-            """
-        ).strip()
-        config_files.append((f"/etc/nginx/sites-available/{service_name}.conf", nginx_conf))
-        commands.extend(
-            [
-                f"sudo ln -sf /etc/nginx/sites-available/{service_name}.conf /etc/nginx/sites-enabled/{service_name}.conf",
-                "sudo nginx -t",
-                "sudo systemctl reload nginx",
-            ]
+        config_files.append(
+            (f"/etc/nginx/sites-available/{service_name}.conf", _NGINX_CONF)
         )
 
-    commands.extend(
-        [
-            "sudo systemctl daemon-reload",
-            f"sudo systemctl enable {service_name}",
-            f"sudo systemctl start {service_name}",
-        ]
-    )
-
     post_checks = [
         f"sudo systemctl status {service_name}",
         f"sudo journalctl -u {service_name} -n 50",
@@ -203,23 +221,67 @@ def prepare_server(
     )
 
 
-def _format_plan(plan: ServerSetupPlan) -> str:
-    """Render the plan as human friendly text for CLI output."""
+def apply_plan(plan: ServerSetupPlan, root: Path) -> List[Path]:
+    """Write the plan's config files under ``root`` and return their paths.
+
+    Writes are grouped by parent directory so each directory is created
+    with a single mkdir call, and contents go out as one write_bytes per
+    file — no per-file mkdir probing or encoder re-entry.
+    """
+
+    by_parent: dict[Path, List[tuple[Path, str]]] = {}
+    for config_path, content in plan.config_files:
+        target = root / config_path.lstrip("/")
+        by_parent.setdefault(target.parent, []).append((target, content))
+
+    written: List[Path] = []
+    for parent, files in by_parent.items():
+        parent.mkdir(parents=True, exist_ok=True)
+        for target, content in files:
+            target.write_bytes(content.encode("utf-8"))
+            written.append(target)
+    return written
+
+
+# Indent prefix for config file contents in the CLI rendering.
+_INDENT_PREFIX = "      "
+
 
-    lines: List[str] = []
-    lines.append(f"Target profile: {plan.target}")
-    lines.append("\nCommands:")
+def _iter_plan_lines(plan: ServerSetupPlan) -> Iterator[str]:
+    """Yield the human friendly CLI rendering of the plan line by line.
+
+    Streaming keeps peak memory at one line regardless of plan size; the
+    config contents are indented per line instead of materializing a
+    separate indented copy of each file.
+    """
+
+    yield f"Target profile: {plan.target}"
+    yield "\nCommands:"
     for item in plan.commands:
-        lines.append(f"  - {item}")
-    lines.append("\nConfig files:")
+        yield f"  - {item}"
+    yield "\nConfig files:"
     for path, content in plan.config_files:
-        lines.append(f"  - {path}:")
-        indented = textwrap.indent(content, prefix="      ")
-        lines.append(indented)
-    lines.append("\nPost-deployment checks:")
+        yield f"  - {path}:"
+        for line in content.splitlines():
+            yield _INDENT_PREFIX + line if line else line
+    yield "\nPost-deployment checks:"
     for check in plan.post_checks:
-        lines.append(f"  - {check}")
-    return "\n".join(lines)
+        yield f"  - {check}"
+
+
+def _format_plan(plan: ServerSetupPlan) -> str:
+    """Render the plan as human friendly text for CLI output."""
+
+    # StringIO grows a single buffer in place; "\n".join would first
+    # collect the generator into a list and only then build the result.
+    buffer = io.StringIO()
+    write = buffer.write
+    separator = ""
+    for line in _iter_plan_lines(plan):
+        write(separator)
+        write(line)
+        separator = "\n"
+    return buffer.getvalue()
 
 
 def main(argv: Optional[Sequence[str]] = None) -> int:
@@ -270,6 +332,12 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         default=[],
         help="Additional pip packages to install inside the virtualenv.",
     )
+    parser.add_argument(
+        "--apply",
+        type=Path,
+        metavar="ROOT",
+        help="Write the generated config files under ROOT (e.g. a staging dir or /).",
+    )
     args = parser.parse_args(argv)
 
     plan = prepare_server(
@@ -283,12 +351,21 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         extra_pip=args.extra_pip,
     )
 
-    print(_format_plan(plan))
+    # Stream the rendering instead of joining one big string first.
+    write = sys.stdout.write
+    for line in _iter_plan_lines(plan):
+        write(line)
+        write("\n")
+
+    if args.apply is not None:
+        for written in apply_plan(plan, args.apply):
+            write(f"Wrote {written}\n")
     return 0
 
 
 __all__ = [
     "ServerSetupPlan",
+    "apply_plan",
     "prepare_server",
     "main",
 ]
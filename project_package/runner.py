@@ -5,8 +5,6 @@ import argparse
 import logging
 from typing import Optional, Sequence
 
-from .project import mail_checker, notifier
-
 LOGGER = logging.getLogger(__name__)
 
 
@@ -55,25 +53,34 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
     logging.basicConfig(level=getattr(logging, args.log_level))
 
     if not args.skip_mail:
+        # Ленивый импорт: --skip-mail и --help не тянут exchangelib и базу.
+        from .project import mail_checker
+
         LOGGER.info("Запускаем обработку почты подрядчика")
-        results = mail_checker.process_mailbox(use_fake=args.fake_mail)
-        if results:
-            for line in results:
-                LOGGER.info("MAIL: %s", line)
-        else:
+        mail_lines = 0
+        for line in mail_checker.process_mailbox(use_fake=args.fake_mail):
+            LOGGER.info("MAIL: %s", line)
+            mail_lines += 1
+        if not mail_lines:
             LOGGER.info("MAIL: новых писем не найдено")
     else:
         LOGGER.info("Обработка почты пропущена (--skip-mail)")
 
     if not args.skip_notifier:
+        # Ленивый импорт по той же причине, что и для mail_checker выше.
+        from .project import notifier
+
         LOGGER.info("Запускаем проверку задержек (%s минут)", args.minutes)
         messages = notifier.notify_delays(
             minutes=args.minutes,
             send=not args.dry_run,
         )
         if messages:
-            for message in messages:
-                LOGGER.info("NOTIFY: %s", message.replace("\n", " | "))
+            # Сглаживание replace() нужно только для лога: не считаем его,
+            # если записи уровня INFO всё равно будут отброшены.
+            if LOGGER.isEnabledFor(logging.INFO):
+                for message in messages:
+                    LOGGER.info("NOTIFY: %s", message.replace("\n", " | "))
         else:
             LOGGER.info(
                 "NOTIFY: задержек не обнаружено (порог %s минут)",